@@ -2,21 +2,23 @@ import asyncio
 from datetime import timedelta
 import logging
 import voluptuous as vol
-import hashlib
 
 
 from homeassistant.core import HomeAssistant
 from homeassistant.config_entries import SOURCE_IMPORT, ConfigEntry
 from homeassistant.helpers.typing import ConfigType
-from homeassistant.exceptions import ConfigEntryNotReady
+from homeassistant.exceptions import ConfigEntryNotReady, ConfigEntryError
 import homeassistant.helpers.config_validation as cv
 from homeassistant.const import CONF_NAME, CONF_UNIQUE_ID, CONF_ENTITY_ID, CONF_ENABLED
 from homeassistant.components.switch import DOMAIN as SWITCH_DOMAIN
 from homeassistant.components.binary_sensor import DOMAIN as BINARY_SENSOR_DOMAIN
+from homeassistant.components.sensor import DOMAIN as SENSOR_DOMAIN
 from homeassistant.components.climate.const import SERVICE_SET_PRESET_MODE
 from homeassistant.util import slugify
 
 from .multizones import ZoneMaster
+from .tree import InvalidZoneTree, config_hash, async_get_tree, async_remove_tree
+from .stats import async_remove_runtime
 
 from .const import (
     DOMAIN,
@@ -26,7 +28,7 @@ from .const import (
     CONFIG_SCHEMA,
 )
 
-PLATFORMS = [ SWITCH_DOMAIN, BINARY_SENSOR_DOMAIN ]
+PLATFORMS = [ SWITCH_DOMAIN, BINARY_SENSOR_DOMAIN, SENSOR_DOMAIN ]
 
 _LOGGER: logging.Logger = logging.getLogger(__package__)
 
@@ -38,20 +40,6 @@ async def async_setup(hass: HomeAssistant, config: ConfigType) -> bool:
     config = config[DOMAIN]
 
     """ Tell whether this config is already available in config_entries """
-    def order_dict(dictionary):
-        # Create a straightforward order of the values. First sort by value, then sort by key
-        return {k: order_dict(v) if isinstance(v, dict) else v for k, v in sorted(dictionary.items())}
-    def sort_dict_keys(input_dict):
-        sorted_dict = {}
-        for key in sorted(input_dict.keys()):
-            value = input_dict[key]
-            if isinstance(value, dict):
-                value = sort_dict_keys(value)
-            elif isinstance(value, (list, tuple)):
-                value = [sort_dict_keys(item) if isinstance(item, dict) else item for item in value]
-            sorted_dict[key] = value
-        return sorted_dict
-
     def imported(iid):
         result = False
         for ce in hass.config_entries.async_entries(DOMAIN):
@@ -62,11 +50,21 @@ async def async_setup(hass: HomeAssistant, config: ConfigType) -> bool:
         return result
 
     # Add the main zone controller                
-    iid =  hashlib.md5(str(sort_dict_keys(config)).encode('utf-8')).hexdigest()
-    #_LOGGER.debug(str(sort_dict_keys(config)))
+    try:
+        iid = config_hash(config)
+    except InvalidZoneTree as err:
+        _LOGGER.error("Invalid zone configuration at %s", err)
+        return False
     #_LOGGER.debug(iid)
 
     if not imported(iid):
+        # New or changed config, validate the whole zone tree before importing it
+        try:
+            await async_get_tree(hass, config)
+        except InvalidZoneTree as err:
+            _LOGGER.error("Invalid zone configuration at %s", err)
+            return False
+
         config[CONF_IMPORT] = iid
         hass.async_create_task(
             hass.config_entries.flow.async_init(
@@ -81,13 +79,22 @@ async def async_setup(hass: HomeAssistant, config: ConfigType) -> bool:
 
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
 
-    zonemaster = ZoneMaster(hass, entry.data, "Master")
+    try:
+        tree = await async_get_tree(hass, entry.data)
+    except InvalidZoneTree as err:
+        raise ConfigEntryError(f"Invalid zone configuration at {err}") from err
+
+    zonemaster = ZoneMaster(hass, entry.data, tree, "Master", entry.entry_id)
+    await zonemaster.stats.async_load()
     if hass.data.get(DOMAIN) is None:
         hass.data.setdefault(DOMAIN, {})[entry.entry_id] = zonemaster
         _LOGGER.info(STARTUP_MESSAGE)
     
     await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
 
+    # Rooms and pumps are added now, apply the schedule and wait for the next transition
+    zonemaster.schedule.start()
+
     return True
 
 async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
@@ -100,6 +107,13 @@ async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     #unload_ok = await hass.config_entries.async_unload_platforms(entry, PLATFORMS)
     unload_ok = True
     if unload_ok:
-        hass.data[DOMAIN].pop(entry.entry_id)
+        zonemaster = hass.data[DOMAIN].pop(entry.entry_id)
+        zonemaster.schedule.stop()
+        await zonemaster.stats.async_stop()
 
     return unload_ok
+
+async def async_remove_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Drop the cached zone tree and the runtime counters of the removed entry."""
+    await async_remove_tree(hass, entry.data)
+    await async_remove_runtime(hass, entry.entry_id)
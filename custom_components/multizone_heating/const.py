@@ -3,7 +3,7 @@ from datetime import timedelta
 
 
 import homeassistant.helpers.config_validation as cv
-from homeassistant.const import CONF_NAME, CONF_UNIQUE_ID, CONF_ENTITY_ID, CONF_ENABLED
+from homeassistant.const import CONF_NAME, CONF_UNIQUE_ID, CONF_ENTITY_ID, CONF_ENABLED, WEEKDAYS
 from homeassistant.components.switch import DOMAIN as SWITCH_DOMAIN
 from homeassistant.components.valve import DOMAIN as VALVE_DOMAIN
 
@@ -32,9 +32,14 @@ CONF_UNIQUE_ID = "unique_id"
 CONF_ENTITY_ID = "entity_id"
 CONF_NAME = "name"
 CONF_TIMEOUT = "timeout"
+CONF_SCHEDULE = "schedule"
+CONF_DAYS = "days"
+CONF_START = "start"
+CONF_END = "end"
 
 
 CONF_IMPORT = "import_id"
+CONF_TITLE = "title" # Added to the entry data by the config flow
 CONF_MAIN = "Main Controller"
 CONF_ZONE = "Zone"
 
@@ -69,27 +74,54 @@ CONFIG_PUMPS = vol.Schema({
     vol.Required(CONF_ENTITY_ID): cv.string,
 })
 
+def time_string(value):
+    """Validate a time, but keep it as a string for the config entry."""
+    return cv.time(value).strftime("%H:%M:%S")
+
+CONFIG_SCHEDULE = vol.Schema({
+    vol.Optional(CONF_DAYS, default=list(WEEKDAYS)): cv.weekdays,
+    vol.Required(CONF_START): time_string,
+    vol.Required(CONF_END): time_string,
+})
+
+# A single node of the zone tree. The nested zones are validated node by node
+# by the tree compiler (see tree.py), so the path of a bad node can be reported.
 CONFIG_ZONES = vol.Schema({
     vol.Required(CONF_NAME): cv.string,
     vol.Optional(CONF_UNIQUE_ID): cv.string,
     vol.Optional(CONF_PUMPS): vol.All([CONFIG_PUMPS]),
-    vol.Optional(CONF_VALVES): vol.All([CONF_VALVES]),
+    vol.Optional(CONF_VALVES): vol.All([CONFIG_VALVES]),
     vol.Optional(CONF_BOOST_TIME): vol.Coerce(float),
-}, extra=vol.ALLOW_EXTRA)
+    vol.Optional(CONF_SCHEDULE): vol.All([CONFIG_SCHEDULE]),
+    vol.Optional(CONF_ZONES): vol.All([dict]),
+})
+
+CONFIG_MAIN = vol.Schema({
+    vol.Required(CONF_SWITCH): cv.string,
+    vol.Required(CONF_ZONES): vol.All([dict]),
+    vol.Optional(CONF_ENABLED): cv.boolean,
+    vol.Optional(CONF_BOOST_TIME): vol.Coerce(int),
+    vol.Optional(CONF_KEEP_ALIVE): vol.All(CONFIG_KEEP_ALIVE),
+    vol.Optional(CONF_KEEP_ACTIVE): vol.Coerce(int),
+    vol.Optional(CONF_SCHEDULE): vol.All([CONFIG_SCHEDULE]),
+})
 
 CONFIG_SCHEMA = vol.Schema({
-    DOMAIN: vol.Schema({
-        vol.Required(CONF_SWITCH): cv.string,
-        vol.Required(CONF_ZONES): vol.All([CONFIG_ZONES]),
-        vol.Optional(CONF_ENABLED): cv.boolean,
-        vol.Optional(CONF_BOOST_TIME): vol.Coerce(int),
-        vol.Optional(CONF_KEEP_ALIVE): vol.All(CONFIG_KEEP_ALIVE),
-        vol.Optional(CONF_KEEP_ACTIVE): vol.Coerce(int),
-    })
+    DOMAIN: CONFIG_MAIN,
     },
     extra = vol.ALLOW_EXTRA,
 )
 
+STORAGE_VERSION = 1
+STORAGE_KEY_TREE = f"{DOMAIN}.tree"
+TREE_VERSION = 2 # Increase, when the format or the rules of the compiled tree change
+STORAGE_KEY_RUNTIME = f"{DOMAIN}.runtime"
+
+# Runtime accounting, in seconds
+RUNTIME_WINDOW = 60 * 60 # Duty cycle of the last hour
+RUNTIME_WRITE_INTERVAL = 30 # Sensor states are written at most this often
+RUNTIME_SAVE_DELAY = 60
+
 STARTUP_MESSAGE = f"""
 -------------------------------------------------------------------
 {NAME}
@@ -8,12 +8,16 @@ from homeassistant.const import (
 
 from slugify import slugify
 
+import asyncio
 import logging
 import copy
 import datetime
+import functools
 
 from .const import DOMAIN, NAME, VERSION, MANUFACTURER, \
     ATTR_POSTACTIVE, ATTR_POSTACTIVE_START, ATTR_POSTACTIVE_END, ATTR_BOOST
+from .schedule import Schedule, ScheduleEngine
+from .stats import Statistics
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -75,6 +79,8 @@ class Pump(BinarySensorEntity):
 
         self._attr_extra_state_attributes = {}
 
+        self.runtime = master.stats.add(f"pump_{name}", name)
+
     async def async_added_to_hass(self):
         """Run when this Entity has been added to HA."""
         self.turn_off()
@@ -85,6 +91,7 @@ class Pump(BinarySensorEntity):
             self._hass.services.async_call("switch", "turn_on", {"entity_id": self.switch})
         )
         self._attr_is_on = True
+        self.master.stats.update(self.runtime, True)
 
         self._attr_extra_state_attributes[ATTR_POSTACTIVE] = False
         self._attr_extra_state_attributes[ATTR_POSTACTIVE_START] = None
@@ -98,6 +105,7 @@ class Pump(BinarySensorEntity):
             self._hass.services.async_call("switch", "turn_off", {"entity_id": self.switch})
         )
         self._attr_is_on = False
+        self.master.stats.update(self.runtime, False)
 
         self._attr_extra_state_attributes[ATTR_POSTACTIVE] = False
         self._attr_extra_state_attributes[ATTR_POSTACTIVE_START] = None
@@ -138,21 +146,32 @@ class Room(SwitchEntity):
         self._master = master
         self.pumps = []
         self.valves = []
+        self.schedule = []
+        self.runtime = master.stats.add(f"room_{name}", name)
         #self.name = name
 
+    def set_state(self, state: bool) -> None:
+        """Change the state without adjusting the master (e.g. from a schedule batch)."""
+        _LOGGER.debug(f"Room {self.name} set state {state}")
+        self._attr_is_on = state
+        self.async_write_ha_state()
+        self._master.stats.update(self.runtime, state)
+
     async def async_turn_on(self, **kwargs) -> None:
         _LOGGER.debug(f"Room {self.name} turn on")
         self._attr_is_on = True
         self.async_write_ha_state()
+        self._master.stats.update(self.runtime, True)
 
-        self._master.adjust()
+        await self._master.adjust()
 
     async def async_turn_off(self, **kwargs) -> None:
         _LOGGER.debug(f"Room {self.name} turn off")
         self._attr_is_on = False
         self.async_write_ha_state()
+        self._master.stats.update(self.runtime, False)
         
-        self._master.adjust()
+        await self._master.adjust()
 
     def __str__(self):
         return f"Room(name={self._name}, pumps=[{self._pumps}], valves=[{self._valves}])"
@@ -170,7 +189,7 @@ class ZoneMaster(BinarySensorEntity):
 
     should_poll = False
 
-    def __init__(self, hass: HomeAssistant, config: dict, name: str) -> None:
+    def __init__(self, hass: HomeAssistant, config: dict, tree: dict, name: str, entry_id: str) -> None:
         self._hass = hass
 
         self._attr_name = name
@@ -178,6 +197,9 @@ class ZoneMaster(BinarySensorEntity):
         self._attr_unique_id = f"multizone_zonemaster_{name}"
         self._attr_is_on = False
 
+        self.stats = Statistics(hass, self, entry_id) # Runtime counters of the master, pumps and rooms
+        self.runtime = self.stats.add("master", name)
+
         self.rooms = []
         self.master_switch = None
 
@@ -196,70 +218,55 @@ class ZoneMaster(BinarySensorEntity):
         self.postactive_pumps = set() # Pumps, which are kept on for a while
         self.postactive_time = int(config.get("keep_active")) * 60 if "keep_active" in config else None
         self.postactive_timer = None
+        self.postactive = False
+        self.postactive_generation = 0 # Tells the timer of the current postactive period
+        self.postactive_expired = False
 
-        def import_pumps(lconf: list):
-            if lconf is None:
-                return []
-            pumps = []
-            for conf in lconf:
-                e = conf.get("entity_id")
-                if e is None:
-                    continue
-                pump = Pump(e, self)
-                self.entities.append(pump)
-                pumps.append(pump)
-            return pumps
+        # Single-flight adjust: at most one evaluation runs, requests meanwhile collapse into one more
+        self.adjust_pending = False
+        self.adjust_task = None
 
-        def import_valves(lconf: list):
-            if lconf is None:
-                return []
-            valves = []
-            for conf in lconf:
-                e = conf.get("switch")
-                if e is None:
-                    continue
-                valves.append(Valve(e, self, "switch"))
-            for conf in lconf:
-                e = conf.get("valve")
-                if e is None:
-                    continue
-                valves.append(Valve(e, self, "valve"))
-            return valves
+        pumps = {} # entity_id -> Pump, shared by the rooms of the zone
+        valves = {} # entity_id -> Valve
 
-        def import_zone(lconf: list, pumps, valves):
-            for conf in lconf:
-                name = conf.get("name") if "name" in conf else "Unknown"
-                new_pumps = []
-                new_valves = []
-                if "pumps" in conf:
-                    new_pumps = import_pumps(conf.get("pumps"))
-                if "valves" in conf:
-                    new_valves = import_valves(conf.get("valves"))
-                new_pumps.extend(pumps)
-                new_valves.extend(valves)
-                if "zones" in conf:
-                    import_zone(conf.get("zones"), new_pumps.copy(), new_valves.copy())
-                else:
-                    room = Room(name, self)
-                    room.pumps = new_pumps
-                    room.valves = new_valves
-                    self.entities.append(room)
-                    self.rooms.append(room)
+        def import_pump(entity_id):
+            if entity_id not in pumps:
+                pump = Pump(entity_id, self)
+                self.entities.append(pump)
+                pumps[entity_id] = pump
+            return pumps[entity_id]
+
+        def import_valve(valve_type, entity_id):
+            if entity_id not in valves:
+                valves[entity_id] = Valve(entity_id, self, valve_type)
+            return valves[entity_id]
 
         _LOGGER.info("ZoneMaster config: %s", config)
         self.master_switch = config.get("switch")
 
-        import_zone([config], [], [])
+        # The zone tree is already validated and flattened into rooms
+        for conf in tree["rooms"]:
+            room = Room(conf["name"], self)
+            room.pumps = [import_pump(e) for e in conf["pumps"]]
+            room.valves = [import_valve(t, e) for t, e in conf["valves"]]
+            room.schedule = conf["schedule"]
+            self.entities.append(room)
+            self.rooms.append(room)
+
+        self.schedule = ScheduleEngine(hass, self, Schedule(self.rooms))
+        self.entities.extend(self.stats.entities)
 
         _LOGGER.info("ZoneMaster params:")
         _LOGGER.info("Master switch: %s", self.master_switch)
         _LOGGER.info("Keep alive timeout: %s", self.keep_alive_timeout)
         _LOGGER.info("Keep alive entity: %s", self.keep_alive_entity)
         _LOGGER.info("Postactive time: %s", self.postactive_time)
+        _LOGGER.info("Schedule: %s", self.schedule.schedule)
         for r in self.rooms:
             _LOGGER.info("Room: %s", r.name)
             _LOGGER.info("Pumps: %s", r.pumps)
             _LOGGER.info("Valves: %s", r.valves)
+            _LOGGER.info("Schedule: %s", r.schedule)
 
     @property
     def device_info(self):
@@ -273,6 +280,7 @@ class ZoneMaster(BinarySensorEntity):
     def turn_on(self):
         _LOGGER.debug(f"Multizone master {self.name} turn on")
         self._attr_is_on = True
+        self.stats.update(self.runtime, True)
         self._hass.async_create_task(
             self._hass.services.async_call("switch", "turn_on", {"entity_id": self.master_switch})
         )
@@ -280,6 +288,7 @@ class ZoneMaster(BinarySensorEntity):
     def turn_off(self):
         _LOGGER.debug(f"Multizone master {self.name} turn off")
         self._attr_is_on = False
+        self.stats.update(self.runtime, False)
         self._hass.async_create_task(
             self._hass.services.async_call("switch", "turn_off", {"entity_id": self.master_switch})
         )
@@ -293,17 +302,21 @@ class ZoneMaster(BinarySensorEntity):
         # Turn off the master switch, at the beginning
         self.turn_off()
 
-    async def postactive_stop(self, _):
-        if self.postactive_timer is not None:
-            self.postactive_timer() # Stop the timer
-        
-        _LOGGER.debug("Postactive stop ends")
-        _LOGGER.debug("Postactive pumps: %s", self.postactive_pumps)
-        for p in self.postactive_pumps:
-            p.turn_off()
+    async def async_will_remove_from_hass(self):
+        """Run when this Entity will be removed from HA."""
+        self.schedule.stop()
+        if self.keep_alive_timer is not None:
+            self.keep_alive_timer()
 
-        self.postactive_pumps = set()
-        self.postactive = False
+    async def postactive_stop(self, generation, _):
+        if generation != self.postactive_generation:
+            return # Timer of an earlier postactive period
+
+        _LOGGER.debug("Postactive stop ends")
+        self.postactive_timer = None
+        self.postactive_expired = True
+        # The pumps are turned off by adjust, unless they are demanded again meanwhile
+        await self.adjust()
 
     async def keep_alive(self, _):
         _LOGGER.debug("Keep alive")
@@ -314,7 +327,27 @@ class ZoneMaster(BinarySensorEntity):
                 )
         self.keep_alive_timer = async_call_later(self._hass, self.keep_alive_timeout, self.keep_alive)
 
-    def adjust(self):
+    def adjust(self) -> asyncio.Task:
+        """Request an evaluation of the demand.
+
+        Room changes, schedule transitions and timers all come here. Only one
+        evaluation runs at a time, the requests arriving meanwhile are served by
+        one more run. The returned task ends, when the request has been served.
+        """
+        self.adjust_pending = True
+        # An eagerly started task may have finished already, before it is stored here
+        if self.adjust_task is None or self.adjust_task.done():
+            self.adjust_task = self._hass.async_create_task(self.adjust_runner())
+        return self.adjust_task
+
+    async def adjust_runner(self):
+        # adjust_task keeps a single runner, and evaluate() does not await,
+        # so no lock is needed around the shared state
+        while self.adjust_pending:
+            self.adjust_pending = False
+            self.evaluate()
+
+    def evaluate(self):
         _LOGGER.debug("Adjusting")
 
         def pumps_set(rooms):
@@ -341,6 +374,9 @@ class ZoneMaster(BinarySensorEntity):
         pac = pumps_set(actual)
         vac = valves_set(actual)
 
+        expired = self.postactive_expired
+        self.postactive_expired = False
+
         # Turn heating on and off basen on demand
         if not pls and pac:
             self.turn_on()
@@ -348,6 +384,7 @@ class ZoneMaster(BinarySensorEntity):
             self.postactive = False
             if self.postactive_timer is not None:
                 self.postactive_timer()
+                self.postactive_timer = None
             pls = pls.union(self.postactive_pumps) # Add pumps, as if they are active
             self.postactive_pumps = set() # Clear the postactive pumps, as they are added to working pumps
 
@@ -357,7 +394,17 @@ class ZoneMaster(BinarySensorEntity):
             if self.postactive_time is not None:
                 self.postactive_pumps = pls.copy()
                 self.postactive = True
-                self.portactive_timer = async_call_later(self._hass, self.postactive_time, self.postactive_stop)
+                self.postactive_generation += 1
+                self.postactive_timer = async_call_later(self._hass, self.postactive_time,
+                    functools.partial(self.postactive_stop, self.postactive_generation))
+
+        elif expired and self.postactive:
+            # Postactive time is over, and there is still no demand
+            _LOGGER.debug("Postactive pumps: %s", self.postactive_pumps)
+            for p in self.postactive_pumps:
+                p.turn_off()
+            self.postactive_pumps = set()
+            self.postactive = False
 
         # Turn pumps on and off based on demand
         for p in pac.union(pls):
@@ -0,0 +1,177 @@
+"""Weekly schedule engine for multizone_heating."""
+
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.event import async_track_point_in_time
+from homeassistant.util import dt as dt_util
+
+import bisect
+import datetime
+import logging
+
+from .const import CONF_DAYS, CONF_START, CONF_END, WEEKDAYS
+
+_LOGGER = logging.getLogger(__name__)
+
+DAY = 24 * 60 * 60
+WEEK = 7 * DAY
+
+
+def _seconds(value: str) -> int:
+    t = dt_util.parse_time(value)
+    return t.hour * 3600 + t.minute * 60 + t.second
+
+
+def _intervals(entries: list) -> list:
+    """Convert schedule entries into merged (start, end) week offsets."""
+    intervals = []
+    for entry in entries:
+        start = _seconds(entry[CONF_START])
+        end = _seconds(entry[CONF_END])
+        length = end - start if end > start else end - start + DAY
+        for day in entry[CONF_DAYS]:
+            s = WEEKDAYS.index(day) * DAY + start
+            e = s + length
+            if e > WEEK:
+                # Sunday night across the end of the week
+                intervals.append((s, WEEK))
+                intervals.append((0, e - WEEK))
+            else:
+                intervals.append((s, e))
+
+    merged = []
+    for s, e in sorted(intervals):
+        if merged and s <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], e))
+        else:
+            merged.append((s, e))
+    return merged
+
+
+def _offset(now: datetime.datetime) -> int:
+    return now.weekday() * DAY + now.hour * 3600 + now.minute * 60 + now.second
+
+
+class Schedule():
+    """Timetable of all rooms, compiled into a sorted list of transitions.
+
+    offsets[i] is a second of the week (Monday 00:00 is 0), batches[i] holds
+    every (room, state) change due at that second.
+    """
+
+    def __init__(self, rooms: list) -> None:
+        self.intervals = {}
+        transitions = {}
+        for room in rooms:
+            if not room.schedule:
+                continue
+            intervals = _intervals(room.schedule)
+            self.intervals[room] = intervals
+            for s, e in intervals:
+                for offset, state in ((s, True), (e % WEEK, False)):
+                    changes = transitions.setdefault(offset, {})
+                    if changes.get(room) is (not state):
+                        # An interval continues across the end of the week
+                        del changes[room]
+                    else:
+                        changes[room] = state
+
+        self.offsets = []
+        self.batches = []
+        for offset in sorted(transitions):
+            if transitions[offset]:
+                self.offsets.append(offset)
+                self.batches.append(tuple(transitions[offset].items()))
+
+    def state(self, room, now: datetime.datetime) -> bool:
+        """Tell whether the room should be on at the given time."""
+        offset = _offset(now)
+        return any(s <= offset < e for s, e in self.intervals.get(room, []))
+
+    def __bool__(self):
+        return bool(self.intervals)
+
+    def __str__(self):
+        return f"Schedule(rooms={len(self.intervals)}, transitions={len(self.offsets)})"
+
+
+class ScheduleEngine():
+    """Sleep until the next transition, apply its batch, adjust once."""
+
+    def __init__(self, hass: HomeAssistant, master, schedule: Schedule) -> None:
+        self._hass = hass
+        self.master = master
+        self.schedule = schedule
+        self.index = None
+        self.timer = None
+
+    def start(self):
+        if not self.schedule:
+            return
+        now = dt_util.now()
+        _LOGGER.debug(f"Schedule start: {self.schedule}")
+
+        # Bring the rooms to the state of the current time
+        if self.sync(now):
+            self.master.adjust()
+
+        if self.schedule.offsets:
+            self.index = self.next_index(now)
+            self.wait(now)
+
+    def stop(self):
+        if self.timer is not None:
+            self.timer()  # Stop the timer
+            self.timer = None
+
+    def wait(self, now: datetime.datetime):
+        offset = self.schedule.offsets[self.index]
+        days = offset // DAY - now.weekday()
+        seconds = offset % DAY
+        if days < 0 or (days == 0 and seconds <= _offset(now) % DAY):
+            days += 7
+        at = datetime.datetime.combine(
+            now.date() + datetime.timedelta(days=days),
+            datetime.time(seconds // 3600, seconds // 60 % 60, seconds % 60),
+            tzinfo=now.tzinfo,
+        )
+        _LOGGER.debug(f"Schedule next transition: {at}")
+        self.timer = async_track_point_in_time(self._hass, self.transition, at)
+
+    def next_index(self, now: datetime.datetime) -> int:
+        """Index of the first transition after now."""
+        return bisect.bisect_right(self.schedule.offsets, _offset(now)) % len(self.schedule.offsets)
+
+    def sync(self, now: datetime.datetime) -> bool:
+        """Set every scheduled room to its state at the given time."""
+        return self.apply((room, self.schedule.state(room, now)) for room in self.schedule.intervals)
+
+    def apply(self, batch) -> bool:
+        """Apply the (room, state) changes, tell if any room changed."""
+        changed = False
+        for room, state in batch:
+            if room.is_on != state:
+                room.set_state(state)
+                changed = True
+        return changed
+
+    async def transition(self, _):
+        self.timer = None
+        # The timer tells the planned time, the clock may be far past it
+        # (suspended host, blocked event loop, clock set by NTP)
+        now = dt_util.now()
+        index = self.next_index(now)
+
+        if index == (self.index + 1) % len(self.schedule.offsets):
+            batch = self.schedule.batches[self.index]
+            _LOGGER.debug(f"Schedule transition: {[(r.name, s) for r, s in batch]}")
+            changed = self.apply(batch)
+        else:
+            # Further transitions have passed meanwhile, their batches are skipped
+            _LOGGER.warning(f"Schedule transition at {now} is late, syncing the rooms to the schedule")
+            changed = self.sync(now)
+
+        self.index = index
+        self.wait(now)
+
+        if changed:
+            await self.master.adjust()
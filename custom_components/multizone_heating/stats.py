@@ -0,0 +1,253 @@
+"""Runtime and duty cycle accounting for multizone_heating."""
+
+from homeassistant.core import HomeAssistant
+from homeassistant.components.sensor import SensorEntity, SensorDeviceClass, SensorStateClass
+from homeassistant.const import EVENT_HOMEASSISTANT_STOP, PERCENTAGE, UnitOfTime
+from homeassistant.helpers.event import async_call_later
+from homeassistant.helpers.storage import Store
+from homeassistant.util import dt as dt_util
+
+from slugify import slugify
+
+from collections import deque
+import logging
+
+from .const import (
+    STORAGE_VERSION, STORAGE_KEY_RUNTIME,
+    RUNTIME_WINDOW, RUNTIME_WRITE_INTERVAL, RUNTIME_SAVE_DELAY,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+KIND_ON_TIME = "on_time"
+KIND_STARTS = "starts"
+KIND_DUTY_CYCLE = "duty_cycle"
+
+
+class Runtime():
+    """Counters of a pump, room or master, updated in constant time on each transition.
+
+    The closed on-intervals of the last window are kept in a deque, together with
+    their total length, so the duty cycle does not need a scan of the history.
+    """
+
+    def __init__(self, key: str, window: int) -> None:
+        self.key = key
+        self.window = window
+        self.on_time = 0.0 # Closed intervals only, seconds
+        self.starts = 0
+        self.on_since = None
+        self.intervals = deque() # (start, end) of the last window
+        self.window_time = 0.0 # Total length of the intervals
+
+    def update(self, state: bool, now: float) -> bool:
+        """Account a transition, tell whether the state has changed."""
+        if state == (self.on_since is not None):
+            return False
+        if state:
+            self.on_since = now
+            self.starts += 1
+        else:
+            self.on_time += now - self.on_since
+            self.intervals.append((self.on_since, now))
+            self.window_time += now - self.on_since
+            self.on_since = None
+        self.expire(now)
+        return True
+
+    def expire(self, now: float):
+        # Every interval is appended and dropped once, so this is amortized O(1)
+        while self.intervals and self.intervals[0][1] <= now - self.window:
+            s, e = self.intervals.popleft()
+            self.window_time -= e - s
+
+    def total(self, now: float) -> float:
+        return self.on_time + (now - self.on_since if self.on_since is not None else 0)
+
+    def duty_cycle(self, now: float) -> float:
+        self.expire(now)
+        start = now - self.window
+        t = self.window_time
+        if self.intervals and self.intervals[0][0] < start:
+            t -= start - self.intervals[0][0]
+        if self.on_since is not None:
+            t += now - max(self.on_since, start)
+        return max(t, 0) / self.window
+
+    def as_dict(self, now: float) -> dict:
+        # A running interval is stored as closed now, everything is off after a restart
+        intervals = list(self.intervals)
+        if self.on_since is not None:
+            intervals.append((self.on_since, now))
+        return {
+            KIND_ON_TIME: self.total(now),
+            KIND_STARTS: self.starts,
+            "intervals": intervals,
+        }
+
+    def restore(self, data: dict, now: float):
+        self.on_time = data.get(KIND_ON_TIME, 0.0)
+        self.starts = data.get(KIND_STARTS, 0)
+        for s, e in data.get("intervals", []):
+            self.intervals.append((s, e))
+            self.window_time += e - s
+        self.expire(now)
+
+    def __str__(self):
+        return f"Runtime(key={self.key}, on_time={self.on_time}, starts={self.starts})"
+
+
+class RuntimeSensor(SensorEntity):
+
+    should_poll = False
+
+    def __init__(self, runtime: Runtime, name: str, kind: str, master) -> None:
+        super().__init__()
+
+        self.runtime = runtime
+        self.kind = kind
+
+        self._attr_name = slugify(f"{name}_{kind}")
+        self._attr_unique_id = slugify(f"multizone_{master.name}_{runtime.key}_{kind}")
+        self._attr_device_info = master.device_info
+
+        if kind == KIND_ON_TIME:
+            self._attr_device_class = SensorDeviceClass.DURATION
+            self._attr_state_class = SensorStateClass.TOTAL_INCREASING
+            self._attr_native_unit_of_measurement = UnitOfTime.HOURS
+            self._attr_suggested_display_precision = 2
+            self._attr_icon = "mdi:timer-outline"
+        elif kind == KIND_STARTS:
+            self._attr_state_class = SensorStateClass.TOTAL_INCREASING
+            self._attr_icon = "mdi:counter"
+        elif kind == KIND_DUTY_CYCLE:
+            self._attr_state_class = SensorStateClass.MEASUREMENT
+            self._attr_native_unit_of_measurement = PERCENTAGE
+            self._attr_suggested_display_precision = 1
+            self._attr_icon = "mdi:percent"
+
+    @property
+    def native_value(self):
+        now = dt_util.utcnow().timestamp()
+        if self.kind == KIND_ON_TIME:
+            return round(self.runtime.total(now) / 3600, 4)
+        if self.kind == KIND_STARTS:
+            return self.runtime.starts
+        return round(self.runtime.duty_cycle(now) * 100, 2)
+
+
+class Statistics():
+    """Runtime counters of a ZoneMaster, their sensors and their storage.
+
+    Sensor states are written at most once in RUNTIME_WRITE_INTERVAL, for the
+    counters which have changed since the last write. While something is on, or
+    the duty cycle still has to fall, the states are also refreshed in every
+    RUNTIME_WRITE_INTERVAL.
+    """
+
+    def __init__(self, hass: HomeAssistant, master, entry_id: str) -> None:
+        self._hass = hass
+        self.master = master
+        self.runtimes = {}
+        self.sensors = {}
+        self.dirty = set()
+        self.write_timer = None
+        self.refresh_timer = None
+        self.last_write = 0.0
+        self.stop_listener = None
+        self._store = runtime_store(hass, entry_id)
+
+    def add(self, key: str, name: str) -> Runtime:
+        runtime = Runtime(key, RUNTIME_WINDOW)
+        self.runtimes[key] = runtime
+        self.sensors[key] = [
+            RuntimeSensor(runtime, name, kind, self.master)
+            for kind in (KIND_ON_TIME, KIND_STARTS, KIND_DUTY_CYCLE)
+        ]
+        return runtime
+
+    @property
+    def entities(self) -> list:
+        return [s for sensors in self.sensors.values() for s in sensors]
+
+    def update(self, runtime: Runtime, state: bool):
+        now = dt_util.utcnow().timestamp()
+        if not runtime.update(state, now):
+            return
+        _LOGGER.debug(f"Runtime update: {runtime}")
+        self.dirty.add(runtime.key)
+        self._store.async_delay_save(self._data, RUNTIME_SAVE_DELAY)
+        self.schedule_refresh()
+        if self.write_timer is not None:
+            return # The pending write will include this change
+        delay = self.last_write + RUNTIME_WRITE_INTERVAL - now
+        if delay <= 0:
+            self.write_states(now)
+        else:
+            self.write_timer = async_call_later(self._hass, delay, self.write)
+
+    async def write(self, _):
+        self.write_timer = None
+        self.write_states(dt_util.utcnow().timestamp())
+
+    def write_states(self, now: float):
+        self.last_write = now
+        for key in self.dirty:
+            for sensor in self.sensors[key]:
+                if sensor.hass is not None:
+                    sensor.async_write_ha_state()
+        self.dirty = set()
+
+    def changing(self, runtime: Runtime) -> bool:
+        """Tell whether the sensors of the runtime change without a transition."""
+        return runtime.on_since is not None or bool(runtime.intervals)
+
+    def schedule_refresh(self):
+        if self.refresh_timer is None and any(self.changing(r) for r in self.runtimes.values()):
+            self.refresh_timer = async_call_later(self._hass, RUNTIME_WRITE_INTERVAL, self.refresh)
+
+    async def refresh(self, _):
+        self.refresh_timer = None
+        now = dt_util.utcnow().timestamp()
+        for key, runtime in self.runtimes.items():
+            if self.changing(runtime):
+                # Also written once more, when the last interval has just left the window
+                runtime.expire(now)
+                self.dirty.add(key)
+        self.write_states(now)
+        self.schedule_refresh()
+
+    def _data(self) -> dict:
+        now = dt_util.utcnow().timestamp()
+        return {key: runtime.as_dict(now) for key, runtime in self.runtimes.items()}
+
+    async def async_load(self):
+        data = await self._store.async_load() or {}
+        now = dt_util.utcnow().timestamp()
+        for key, d in data.items():
+            if key in self.runtimes:
+                self.runtimes[key].restore(d, now)
+        self.schedule_refresh()
+        self.stop_listener = self._hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, self.async_stop)
+
+    async def async_stop(self, event=None):
+        """Store the counters, including the running intervals."""
+        if self.write_timer is not None:
+            self.write_timer() # Stop the timer
+            self.write_timer = None
+        if self.refresh_timer is not None:
+            self.refresh_timer() # Stop the timer
+            self.refresh_timer = None
+        if self.stop_listener is not None and event is None:
+            self.stop_listener()
+        self.stop_listener = None
+        await self._store.async_save(self._data())
+
+
+def runtime_store(hass: HomeAssistant, entry_id: str) -> Store:
+    """Every config entry has its own counters."""
+    return Store(hass, STORAGE_VERSION, f"{STORAGE_KEY_RUNTIME}.{entry_id}")
+
+
+async def async_remove_runtime(hass: HomeAssistant, entry_id: str) -> None:
+    await runtime_store(hass, entry_id).async_remove()
@@ -0,0 +1,151 @@
+"""Zone tree validation and compilation for multizone_heating."""
+
+from homeassistant.core import HomeAssistant
+from homeassistant.exceptions import HomeAssistantError
+from homeassistant.helpers.storage import Store
+
+import hashlib
+import logging
+import voluptuous as vol
+from slugify import slugify
+
+from .const import (
+    CONF_IMPORT, CONF_TITLE, CONF_NAME, CONF_ZONES, CONF_PUMPS, CONF_VALVES, CONF_SWITCH, CONF_VALVE,
+    CONF_ENTITY_ID, CONF_SCHEDULE, CONFIG_MAIN, CONFIG_ZONES,
+    STORAGE_VERSION, STORAGE_KEY_TREE, TREE_VERSION,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class InvalidZoneTree(HomeAssistantError):
+    """Error to indicate a bad node in the zone tree."""
+
+    def __init__(self, path: str, message: str) -> None:
+        super().__init__(f"{path}: {message}")
+        self.path = path
+
+
+def zone_config(config) -> dict:
+    """The config without the keys added by the import and the config flow."""
+    return {k: v for k, v in config.items() if k not in (CONF_IMPORT, CONF_TITLE)}
+
+
+def config_hash(config: dict) -> str:
+    """Hash of the config, independent of the order of the keys.
+
+    This is the first walk over a YAML config, so a zone containing itself
+    through an alias is reported here as a cyclic reference.
+    """
+    stack = set() # Containers on the current path
+
+    def sort_dict_keys(input_dict, path):
+        if id(input_dict) in stack:
+            raise InvalidZoneTree(path, "cyclic zone reference")
+        stack.add(id(input_dict))
+        sorted_dict = {}
+        for key in sorted(input_dict.keys()):
+            value = input_dict[key]
+            if isinstance(value, dict):
+                value = sort_dict_keys(value, f"{path} > {key}")
+            elif isinstance(value, (list, tuple)):
+                value = [sort_dict_keys(item, f"{path} > {key}[{i}]") if isinstance(item, dict) else item
+                    for i, item in enumerate(value)]
+            sorted_dict[key] = value
+        stack.remove(id(input_dict))
+        return sorted_dict
+
+    return hashlib.md5(str(sort_dict_keys(zone_config(config), "main")).encode('utf-8')).hexdigest()
+
+
+def cache_key(config) -> str:
+    return f"{TREE_VERSION}_{config.get(CONF_IMPORT) or config_hash(config)}"
+
+
+def compile_tree(config: dict) -> dict:
+    """Validate the zone tree and flatten it into rooms.
+
+    The result is a plain dict, which can be stored as it is:
+    {"rooms": [{"name", "pumps": [entity_id], "valves": [[type, entity_id]], "schedule": [...]}]}
+    Pumps and valves of the parent zones are inherited, the own ones come first.
+    Room names must be unique, they identify the entities and the runtime counters.
+    """
+    used = {}  # entity_id -> path, where it is referenced
+    names = {}  # slug of a room name -> path of the room
+    rooms = []
+
+    try:
+        main = CONFIG_MAIN(zone_config(config))
+    except vol.Invalid as err:
+        raise InvalidZoneTree("main", str(err)) from err
+    use(used, main[CONF_SWITCH], "main")
+
+    def compile_zone(conf, path, pumps, valves, schedule):
+        own_pumps = []
+        for i, p in enumerate(conf.get(CONF_PUMPS, [])):
+            use(used, p[CONF_ENTITY_ID], f"{path} > pumps[{i}]")
+            own_pumps.append(p[CONF_ENTITY_ID])
+        own_valves = []
+        for i, v in enumerate(conf.get(CONF_VALVES, [])):
+            if CONF_SWITCH not in v and CONF_VALVE not in v:
+                raise InvalidZoneTree(f"{path} > valves[{i}]", f"either {CONF_SWITCH} or {CONF_VALVE} is required")
+        for t in (CONF_SWITCH, CONF_VALVE):
+            for i, v in enumerate(conf.get(CONF_VALVES, [])):
+                if t in v:
+                    use(used, v[t], f"{path} > valves[{i}]")
+                    own_valves.append([t, v[t]])
+        pumps = own_pumps + pumps
+        valves = own_valves + valves
+        schedule = conf.get(CONF_SCHEDULE, []) + schedule
+
+        if CONF_ZONES not in conf:
+            use(names, slugify(conf[CONF_NAME]), path, f"room name {conf[CONF_NAME]}")
+            rooms.append({
+                "name": conf[CONF_NAME],
+                "pumps": pumps,
+                "valves": valves,
+                "schedule": schedule,
+            })
+            return
+
+        for i, zone in enumerate(conf[CONF_ZONES]):
+            zpath = f"{path} > zones[{i}]"
+            try:
+                zconf = CONFIG_ZONES(zone)
+            except vol.Invalid as err:
+                raise InvalidZoneTree(zpath, str(err)) from err
+            compile_zone(zconf, f"{zpath} '{zconf[CONF_NAME]}'", pumps, valves, schedule)
+
+    compile_zone(main, "main", [], [], [])
+    return {"rooms": rooms}
+
+
+def use(used: dict, key: str, path: str, what: str = None):
+    if key in used:
+        raise InvalidZoneTree(path, f"{what or key} is already used at {used[key]}")
+    used[key] = path
+
+
+async def async_get_tree(hass: HomeAssistant, config: dict) -> dict:
+    """Get the compiled tree from the cache, or compile and store it."""
+    key = cache_key(config)
+    store = Store(hass, STORAGE_VERSION, STORAGE_KEY_TREE)
+    cache = await store.async_load() or {}
+    if key in cache:
+        _LOGGER.debug(f"Zone tree {key} is cached")
+        return cache[key]
+
+    tree = compile_tree(config)
+    # Trees of an earlier TREE_VERSION will not be used again
+    cache = {k: v for k, v in cache.items() if k.startswith(f"{TREE_VERSION}_")}
+    cache[key] = tree
+    await store.async_save(cache)
+    return tree
+
+
+async def async_remove_tree(hass: HomeAssistant, config: dict) -> None:
+    key = cache_key(config)
+    store = Store(hass, STORAGE_VERSION, STORAGE_KEY_TREE)
+    cache = await store.async_load() or {}
+    if cache.pop(key, None) is not None:
+        await store.async_save(cache)
@@ -0,0 +1 @@
+"""Tests for multizone_heating."""
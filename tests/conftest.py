@@ -0,0 +1,10 @@
+"""Global fixtures for multizone_heating."""
+import pytest
+
+pytest_plugins = "pytest_homeassistant_custom_component"
+
+
+@pytest.fixture(autouse=True)
+def auto_enable_custom_integrations(enable_custom_integrations):
+    """Enable loading the custom integration in every test."""
+    yield
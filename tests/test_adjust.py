@@ -0,0 +1,256 @@
+"""Stress tests for the single-flight adjust."""
+import asyncio
+import random
+import sys
+import types
+
+from homeassistant.setup import async_setup_component
+import pytest
+
+from custom_components.multizone_heating import multizones
+from custom_components.multizone_heating.const import DOMAIN
+from custom_components.multizone_heating.multizones import Pump, ZoneMaster
+
+CONFIG = {
+    "switch": "switch.main",
+    "keep_active": 60,
+    "zones": [
+        {
+            "name": "Floor 1",
+            "pumps": [{"entity_id": "switch.pump1"}],
+            "zones": [
+                {"name": "Room A"},
+                {
+                    "name": "Wing",
+                    "pumps": [{"entity_id": "switch.pump3"}],
+                    "zones": [{"name": "Room B"}, {"name": "Room C"}],
+                },
+            ],
+        },
+        {
+            "name": "Floor 2",
+            "pumps": [{"entity_id": "switch.pump2"}],
+            "zones": [{"name": "Room D"}],
+        },
+    ],
+}
+
+
+def demanded_pumps(zonemaster):
+    pumps = set()
+    for room in zonemaster.rooms:
+        if room.is_on:
+            pumps.update(room.pumps)
+    return pumps
+
+
+@types.coroutine
+def resume(coro, yielded):
+    """Go on with a coroutine, which was started outside of a task."""
+    while True:
+        try:
+            value = yield yielded
+        except BaseException as err:
+            step, arg = coro.throw, err
+        else:
+            step, arg = coro.send, value
+        try:
+            yielded = step(arg)
+        except StopIteration as done:
+            return done.value
+
+
+async def resumed(coro, yielded):
+    return await resume(coro, yielded)
+
+
+@pytest.fixture
+def eager_tasks(hass, monkeypatch):
+    """Start every task of hass.async_create_task eagerly, as newer HA releases do.
+
+    Python 3.12 starts a task with eager_start, on earlier versions the
+    coroutine is run here up to its first suspension.
+    """
+    create_task = hass.async_create_task
+
+    def eager_create_task(target, name=None, eager_start=False):
+        if sys.version_info >= (3, 12):
+            return create_task(target, name, eager_start=True)
+        future = hass.loop.create_future()
+        try:
+            yielded = target.send(None)
+        except StopIteration as done:
+            future.set_result(done.value)
+        except Exception as err:
+            future.set_exception(err)
+        else:
+            return create_task(resumed(target, yielded), name)
+        return future
+
+    monkeypatch.setattr(hass, "async_create_task", eager_create_task)
+
+
+@pytest.fixture
+async def zonemaster(hass, monkeypatch):
+    """The ZoneMaster, with checks on pump turn off and on the runners in flight."""
+    assert await async_setup_component(hass, DOMAIN, {DOMAIN: CONFIG})
+    await hass.async_block_till_done()
+    entry = hass.config_entries.async_entries(DOMAIN)[0]
+    zm = hass.data[DOMAIN][entry.entry_id]
+
+    zm.violations = []
+    zm.runners = 0
+    zm.max_runners = 0
+    zm.evaluations = 0
+
+    turn_off = Pump.turn_off
+
+    def checked_turn_off(pump):
+        if pump in demanded_pumps(zm):
+            zm.violations.append(f"{pump.name} switched off while demanded")
+        turn_off(pump)
+
+    adjust_runner = ZoneMaster.adjust_runner
+
+    async def counted_runner(self):
+        self.runners += 1
+        self.max_runners = max(self.max_runners, self.runners)
+        try:
+            await adjust_runner(self)
+        finally:
+            self.runners -= 1
+
+    evaluate = ZoneMaster.evaluate
+
+    def counted_evaluate(self):
+        self.evaluations += 1
+        evaluate(self)
+
+    # The tests fire postactive_stop themselves, the real timers are cancelled at the end
+    timers = []
+    call_later = multizones.async_call_later
+
+    def tracked_call_later(*args):
+        timers.append(call_later(*args))
+        return timers[-1]
+
+    monkeypatch.setattr(multizones, "async_call_later", tracked_call_later)
+    monkeypatch.setattr(Pump, "turn_off", checked_turn_off)
+    monkeypatch.setattr(ZoneMaster, "adjust_runner", counted_runner)
+    monkeypatch.setattr(ZoneMaster, "evaluate", counted_evaluate)
+
+    yield zm
+
+    for cancel in timers:
+        cancel()
+    assert await hass.config_entries.async_unload(entry.entry_id)
+
+
+def check_settled(zm):
+    demand = demanded_pumps(zm)
+    running = {p for p in zm.entities if isinstance(p, Pump) and p.is_on}
+    assert not zm.violations, zm.violations
+    assert zm.is_on == bool(demand)
+    if demand:
+        assert not zm.postactive_pumps
+        assert not zm.postactive
+        assert running == demand
+    elif zm.postactive:
+        assert running == zm.postactive_pumps
+    else:
+        assert not running
+
+
+async def test_postactive_stop_right_after_turn_on(hass, zonemaster):
+    zm = zonemaster
+    room = zm.rooms[0]
+    await room.async_turn_on()
+    await room.async_turn_off()
+    assert zm.postactive
+    pumps = set(zm.postactive_pumps)
+
+    # The timer fires in the same tick, as the room is turned on again
+    turn_on = hass.async_create_task(room.async_turn_on())
+    stop = hass.async_create_task(zm.postactive_stop(zm.postactive_generation, None))
+    await asyncio.gather(turn_on, stop)
+    await hass.async_block_till_done()
+
+    assert all(p.is_on for p in pumps)
+    check_settled(zm)
+
+
+async def test_stale_postactive_timer_is_ignored(hass, zonemaster):
+    zm = zonemaster
+    room = zm.rooms[0]
+    await room.async_turn_on()
+    await room.async_turn_off()
+    stale = zm.postactive_generation
+    await room.async_turn_on()
+    await room.async_turn_off()
+
+    await zm.postactive_stop(stale, None)
+    await hass.async_block_till_done()
+    assert zm.postactive
+    assert all(p.is_on for p in zm.postactive_pumps)
+
+    await zm.postactive_stop(zm.postactive_generation, None)
+    await hass.async_block_till_done()
+    assert not zm.postactive
+    check_settled(zm)
+
+
+async def test_every_request_is_evaluated_with_eager_tasks(hass, zonemaster, eager_tasks):
+    """An eager runner ends before adjust() gets its task."""
+    zm = zonemaster
+    for _ in range(3):
+        await zm.adjust()
+    assert zm.evaluations == 3
+
+    room = zm.rooms[0]
+    await room.async_turn_on()
+    assert all(p.is_on for p in room.pumps)
+    await room.async_turn_off()
+    assert zm.postactive
+    await zm.postactive_stop(zm.postactive_generation, None)
+    await hass.async_block_till_done()
+    assert not any(p.is_on for p in room.pumps)
+    assert zm.evaluations == 6
+    check_settled(zm)
+
+
+@pytest.mark.parametrize("eager", [False, True])
+@pytest.mark.parametrize("seed", range(3))
+async def test_random_interleaving(hass, zonemaster, seed, eager, request):
+    if eager:
+        request.getfixturevalue("eager_tasks")
+    zm = zonemaster
+    rng = random.Random(seed)
+    pending = []
+    steps = 3000
+
+    for _ in range(steps):
+        action = rng.random()
+        if action < 0.5:
+            room = rng.choice(zm.rooms)
+            handler = room.async_turn_off if room.is_on else room.async_turn_on
+            pending.append(hass.async_create_task(handler()))
+        elif action < 0.7:
+            # Current, stale and not yet existing generations
+            generation = rng.randint(0, zm.postactive_generation + 1)
+            pending.append(hass.async_create_task(zm.postactive_stop(generation, None)))
+        elif action < 0.9:
+            await asyncio.sleep(0)
+        else:
+            await asyncio.gather(*pending)
+            pending = []
+            await hass.async_block_till_done()
+            check_settled(zm)
+        assert zm.max_runners <= 1
+        assert not zm.violations, zm.violations
+
+    await asyncio.gather(*pending)
+    await hass.async_block_till_done()
+    check_settled(zm)
+    assert zm.max_runners == 1
+    # Triggers arriving in the same tick are served by one evaluation
+    assert zm.evaluations < steps * 0.7
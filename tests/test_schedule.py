@@ -0,0 +1,218 @@
+"""Tests for the weekly schedule compiler."""
+import datetime
+from pathlib import Path
+
+from homeassistant.config_entries import ConfigEntryState
+from homeassistant.setup import async_setup_component
+from homeassistant.util import dt as dt_util
+import pytest
+from pytest_homeassistant_custom_component.common import async_fire_time_changed
+import yaml
+
+from custom_components.multizone_heating.const import DOMAIN
+from custom_components.multizone_heating.multizones import ZoneMaster
+from custom_components.multizone_heating.schedule import (
+    DAY,
+    WEEK,
+    Schedule,
+    _intervals,
+)
+
+EXAMPLE = Path(__file__).parent.parent / "example-configuration.yaml"
+
+H = 3600
+MON, TUE, SUN = 0, DAY, 6 * DAY
+
+CONFIG = {
+    "switch": "switch.main",
+    "zones": [
+        {
+            "name": "Floor",
+            "pumps": [{"entity_id": "switch.pump1"}],
+            "zones": [
+                {"name": "Room A", "schedule": [{"start": "06:00", "end": "08:00"}]},
+                {"name": "Room B", "schedule": [{"start": "07:00", "end": "09:00", "days": ["tue"]}]},
+                {"name": "Room C", "schedule": [{"start": "06:00", "end": "08:00"}]},
+            ],
+        }
+    ],
+}
+
+
+class FakeRoom:
+    """Only the schedule of a room is used by the compiler."""
+
+    def __init__(self, name, schedule):
+        self.name = name
+        self.schedule = schedule
+
+
+def entry(start, end, days=("mon",)):
+    return {"days": list(days), "start": start, "end": end}
+
+
+def test_single_interval():
+    assert _intervals([entry("06:00:00", "08:00:00")]) == [(MON + 6 * H, MON + 8 * H)]
+
+
+def test_end_before_start_crosses_midnight():
+    assert _intervals([entry("22:00:00", "06:00:00")]) == [(MON + 22 * H, TUE + 6 * H)]
+
+
+def test_end_equal_start_is_a_whole_day():
+    assert _intervals([entry("06:00:00", "06:00:00")]) == [(MON + 6 * H, TUE + 6 * H)]
+
+
+def test_sunday_night_wraps_into_monday():
+    assert _intervals([entry("22:00:00", "06:00:00", ["sun"])]) == [
+        (MON, MON + 6 * H),
+        (SUN + 22 * H, WEEK),
+    ]
+
+
+def test_overlapping_and_touching_intervals_merge():
+    assert _intervals([
+        entry("06:00:00", "08:00:00"),
+        entry("07:00:00", "09:00:00"),
+        entry("09:00:00", "10:00:00"),
+        entry("12:00:00", "13:00:00"),
+    ]) == [(MON + 6 * H, MON + 10 * H), (MON + 12 * H, MON + 13 * H)]
+
+
+def test_schedule_transitions_are_batched_and_sorted():
+    a = FakeRoom("a", [entry("06:00:00", "08:00:00", ["mon", "tue"])])
+    b = FakeRoom("b", [entry("06:00:00", "07:00:00", ["tue"])])
+    c = FakeRoom("c", [])
+    schedule = Schedule([a, b, c])
+
+    assert schedule.offsets == [MON + 6 * H, MON + 8 * H, TUE + 6 * H, TUE + 7 * H, TUE + 8 * H]
+    assert dict(schedule.batches[2]) == {a: True, b: True}
+    assert dict(schedule.batches[3]) == {b: False}
+    assert c not in schedule.intervals
+
+
+def test_schedule_across_the_end_of_the_week_has_no_transition_at_monday_midnight():
+    room = FakeRoom("a", [
+        entry("22:00:00", "06:00:00", ["sun"]),
+        entry("06:00:00", "08:00:00", ["mon"]),
+    ])
+    schedule = Schedule([room])
+
+    assert schedule.offsets == [MON + 8 * H, SUN + 22 * H]
+    assert schedule.batches == [((room, False),), ((room, True),)]
+
+
+def test_schedule_covering_the_whole_week_is_always_on():
+    week = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+    room = FakeRoom("a", [entry("00:00:00", "00:00:00", week)])
+    schedule = Schedule([room])
+
+    assert schedule.intervals[room] == [(0, WEEK)]
+    assert schedule.offsets == []
+    assert schedule.batches == []
+    for day in range(7):
+        for hour in (0, 12, 23):
+            now = datetime.datetime(2026, 10, 19 + day, hour, 30)
+            assert schedule.state(room, now)
+
+
+def test_state_follows_the_intervals():
+    room = FakeRoom("a", [entry("22:00:00", "06:00:00", ["sun"])])
+    schedule = Schedule([room])
+
+    # 2026-10-19 is a Monday
+    assert schedule.state(room, datetime.datetime(2026, 10, 19, 5, 59))
+    assert not schedule.state(room, datetime.datetime(2026, 10, 19, 6, 0))
+    assert not schedule.state(room, datetime.datetime(2026, 10, 25, 21, 59))
+    assert schedule.state(room, datetime.datetime(2026, 10, 25, 22, 0))
+    assert not Schedule([FakeRoom("b", [])])
+
+
+async def test_example_configuration_sets_up(hass):
+    """Nested schedule entries without days get the defaults."""
+    config = yaml.safe_load(EXAMPLE.read_text())
+    del config[DOMAIN]["keep_alive"] # Its timer is only cancelled with the entities
+    assert await async_setup_component(hass, DOMAIN, config)
+    await hass.async_block_till_done()
+
+    entry = hass.config_entries.async_entries(DOMAIN)[0]
+    assert entry.state is ConfigEntryState.LOADED
+    zonemaster = hass.data[DOMAIN][entry.entry_id]
+    room = next(r for r in zonemaster.rooms if r.schedule)
+    assert room.schedule[1]["days"] == ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+    assert len(zonemaster.schedule.schedule.offsets) == 24
+
+    assert await hass.config_entries.async_unload(entry.entry_id)
+
+
+def local(day, hour, minute=0):
+    """Local time on a day of the week of 2026-10-19, a Monday."""
+    return datetime.datetime(2026, 10, 19 + day, hour, minute, tzinfo=dt_util.DEFAULT_TIME_ZONE)
+
+
+@pytest.fixture
+async def scheduled(hass, freezer, monkeypatch):
+    """A ZoneMaster with scheduled rooms, started on Monday 05:00, counting evaluations."""
+    freezer.move_to(local(0, 5))
+    evaluate = ZoneMaster.evaluate
+
+    def counted_evaluate(self):
+        self.evaluations += 1
+        evaluate(self)
+
+    monkeypatch.setattr(ZoneMaster, "evaluations", 0, raising=False)
+    monkeypatch.setattr(ZoneMaster, "evaluate", counted_evaluate)
+    assert await async_setup_component(hass, DOMAIN, {DOMAIN: CONFIG})
+    await hass.async_block_till_done()
+
+    entry = hass.config_entries.async_entries(DOMAIN)[0]
+    zonemaster = hass.data[DOMAIN][entry.entry_id]
+    yield zonemaster, {r.name: r for r in zonemaster.rooms}
+
+    assert await hass.config_entries.async_unload(entry.entry_id)
+
+
+async def move_to(hass, freezer, at):
+    freezer.move_to(at)
+    async_fire_time_changed(hass)
+    await hass.async_block_till_done()
+
+
+async def test_transition_applies_the_batch_with_one_evaluation(hass, freezer, scheduled):
+    zonemaster, rooms = scheduled
+    assert not any(r.is_on for r in rooms.values())
+    assert zonemaster.evaluations == 0
+
+    await move_to(hass, freezer, local(0, 6))
+    assert rooms["room-a"].is_on and rooms["room-c"].is_on
+    assert not rooms["room-b"].is_on
+    assert zonemaster.evaluations == 1
+    assert zonemaster.is_on
+
+    await move_to(hass, freezer, local(0, 8))
+    assert not any(r.is_on for r in rooms.values())
+    assert zonemaster.evaluations == 2
+
+    # The timer is armed for the next day
+    await move_to(hass, freezer, local(1, 6))
+    assert rooms["room-a"].is_on and rooms["room-c"].is_on
+    await move_to(hass, freezer, local(1, 7))
+    assert rooms["room-b"].is_on
+    assert zonemaster.evaluations == 4
+
+
+async def test_late_transition_syncs_to_the_clock(hass, freezer, scheduled):
+    zonemaster, rooms = scheduled
+
+    # The timer of Monday 06:00 fires only on Tuesday 08:30
+    await move_to(hass, freezer, local(1, 8, 30))
+    assert not rooms["room-a"].is_on
+    assert rooms["room-b"].is_on # Its batch at Tuesday 07:00 was skipped
+    assert zonemaster.evaluations == 1
+
+    # The following transitions come on time
+    await move_to(hass, freezer, local(1, 9))
+    assert not rooms["room-b"].is_on
+    await move_to(hass, freezer, local(2, 6))
+    assert rooms["room-a"].is_on and rooms["room-c"].is_on
+    assert zonemaster.evaluations == 3
@@ -0,0 +1,161 @@
+"""Tests for the runtime and duty cycle accounting."""
+from datetime import timedelta
+import random
+
+from homeassistant.setup import async_setup_component
+import pytest
+from pytest_homeassistant_custom_component.common import (
+    MockConfigEntry,
+    async_fire_time_changed,
+)
+
+from custom_components.multizone_heating.const import (
+    DOMAIN,
+    NAME,
+    RUNTIME_WINDOW,
+    RUNTIME_WRITE_INTERVAL,
+    STORAGE_KEY_RUNTIME,
+)
+from custom_components.multizone_heating.stats import Runtime
+
+CONFIG = {
+    "switch": "switch.main",
+    "zones": [
+        {
+            "name": "Floor",
+            "pumps": [{"entity_id": "switch.pump1"}],
+            "zones": [{"name": "Room A"}, {"name": "Room B"}],
+        }
+    ],
+}
+
+
+def brute_force_duty_cycle(events, now, window):
+    on, since = 0, None
+    for t, state in events:
+        if state:
+            since = t
+        else:
+            on += max(0, t - max(since, now - window))
+            since = None
+    if since is not None:
+        on += now - max(since, now - window)
+    return on / window
+
+
+def test_runtime_counts_transitions():
+    runtime = Runtime("pump", 100)
+
+    assert runtime.update(True, 10)
+    assert not runtime.update(True, 20)
+    assert runtime.update(False, 30)
+    assert runtime.update(True, 50)
+
+    assert runtime.starts == 2
+    assert runtime.total(60) == 30
+    assert runtime.duty_cycle(60) == pytest.approx(0.3)
+    # The first interval leaves the window, the second runs on
+    assert runtime.duty_cycle(200) == pytest.approx(1.0)
+    runtime.update(False, 200)
+    assert runtime.duty_cycle(400) == 0
+    assert not runtime.intervals
+
+
+def test_duty_cycle_matches_the_history():
+    rng = random.Random(42)
+    runtime = Runtime("pump", 100)
+    events, state, now = [], False, 0.0
+    for _ in range(5000):
+        t = now + rng.uniform(0, 20)
+        state = not state
+        runtime.update(state, t)
+        events.append((t, state))
+        now = t + rng.uniform(0, 5)
+        assert runtime.duty_cycle(now) == pytest.approx(brute_force_duty_cycle(events, now, 100))
+    # Only the intervals of the window are kept
+    assert len(runtime.intervals) < 20
+
+
+def test_runtime_restore():
+    runtime = Runtime("pump", 100)
+    runtime.update(True, 10)
+    runtime.update(False, 30)
+    runtime.update(True, 50)
+    data = runtime.as_dict(60)
+
+    restored = Runtime("pump", 100)
+    restored.restore(data, 70)
+    assert restored.on_since is None
+    assert restored.starts == 2
+    assert restored.total(70) == 30
+    assert restored.duty_cycle(70) == pytest.approx(0.3)
+
+
+async def setup_entry(hass):
+    assert await async_setup_component(hass, DOMAIN, {DOMAIN: CONFIG})
+    await hass.async_block_till_done()
+    return hass.config_entries.async_entries(DOMAIN)[0]
+
+
+async def test_sensors_are_refreshed_while_changing(hass, freezer):
+    entry = await setup_entry(hass)
+    zonemaster = hass.data[DOMAIN][entry.entry_id]
+
+    await hass.services.async_call("switch", "turn_on", {"entity_id": "switch.room_a"}, blocking=True)
+    await hass.async_block_till_done()
+    assert hass.states.get("sensor.room_a_starts").state == "1"
+
+    # No transition for 6 hours, the on time still grows
+    for _ in range(6 * 3600 // RUNTIME_WRITE_INTERVAL):
+        freezer.tick(timedelta(seconds=RUNTIME_WRITE_INTERVAL))
+        async_fire_time_changed(hass)
+        await hass.async_block_till_done()
+    assert float(hass.states.get("sensor.room_a_on_time").state) == pytest.approx(6, abs=0.01)
+    assert float(hass.states.get("sensor.pump1_on_time").state) == pytest.approx(6, abs=0.01)
+    assert float(hass.states.get("sensor.room_a_duty_cycle").state) == 100
+
+    await hass.services.async_call("switch", "turn_off", {"entity_id": "switch.room_a"}, blocking=True)
+    await hass.async_block_till_done()
+
+    # The duty cycle falls to 0 as the window moves on, then the refresh stops
+    for _ in range(RUNTIME_WINDOW // RUNTIME_WRITE_INTERVAL + 2):
+        freezer.tick(timedelta(seconds=RUNTIME_WRITE_INTERVAL))
+        async_fire_time_changed(hass)
+        await hass.async_block_till_done()
+    assert float(hass.states.get("sensor.room_a_duty_cycle").state) == 0
+    assert float(hass.states.get("sensor.master_duty_cycle").state) == 0
+    assert float(hass.states.get("sensor.room_a_on_time").state) == pytest.approx(6, abs=0.01)
+    assert zonemaster.stats.refresh_timer is None
+
+    assert await hass.config_entries.async_unload(entry.entry_id)
+
+
+async def test_counters_are_stored_per_entry(hass, hass_storage):
+    entry = MockConfigEntry(domain=DOMAIN, title=NAME, data=CONFIG)
+    entry.add_to_hass(hass)
+    key = f"{STORAGE_KEY_RUNTIME}.{entry.entry_id}"
+    other = f"{STORAGE_KEY_RUNTIME}.other_entry"
+    for k, starts in ((key, 5), (other, 9)):
+        hass_storage[k] = {
+            "version": 1,
+            "key": k,
+            "data": {"master": {"on_time": 7200, "starts": starts, "intervals": []}},
+        }
+
+    assert await hass.config_entries.async_setup(entry.entry_id)
+    await hass.async_block_till_done()
+    zonemaster = hass.data[DOMAIN][entry.entry_id]
+    assert zonemaster.stats.runtimes["master"].starts == 5
+
+    await hass.services.async_call("switch", "turn_on", {"entity_id": "switch.room_a"}, blocking=True)
+    await hass.async_block_till_done()
+    assert await hass.config_entries.async_unload(entry.entry_id)
+
+    assert hass_storage[key]["data"]["master"]["starts"] == 6
+    assert hass_storage[key]["data"]["room_Room A"]["starts"] == 1
+    assert hass_storage[other]["data"]["master"]["starts"] == 9
+
+    await hass.config_entries.async_remove(entry.entry_id)
+    await hass.async_block_till_done()
+    assert key not in hass_storage
+    assert other in hass_storage
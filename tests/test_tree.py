@@ -0,0 +1,179 @@
+"""Tests for the zone tree validation and compilation."""
+import copy
+from pathlib import Path
+from unittest.mock import patch
+
+from homeassistant.config_entries import ConfigEntryState
+from homeassistant.setup import async_setup_component
+import pytest
+from pytest_homeassistant_custom_component.common import MockConfigEntry
+import yaml
+
+from custom_components.multizone_heating.const import (
+    CONF_IMPORT,
+    CONF_TITLE,
+    CONFIG_SCHEMA,
+    DOMAIN,
+    NAME,
+    STORAGE_KEY_TREE,
+    STORAGE_VERSION,
+    TREE_VERSION,
+)
+from custom_components.multizone_heating.tree import (
+    InvalidZoneTree,
+    async_get_tree,
+    compile_tree,
+    config_hash,
+)
+
+EXAMPLE = Path(__file__).parent.parent / "example-configuration.yaml"
+
+
+@pytest.fixture
+def config():
+    """The example configuration, as HA validates it, without timers."""
+    conf = CONFIG_SCHEMA(yaml.safe_load(EXAMPLE.read_text()))[DOMAIN]
+    del conf["keep_alive"]
+    return conf
+
+
+def test_compile_example(config):
+    rooms = {r["name"]: r for r in compile_tree(config)["rooms"]}
+
+    assert list(rooms) == ["SZ_A", "SZ_B", "SZ_C"]
+    assert rooms["SZ_A"]["pumps"] == ["switch.pump1"]
+    assert rooms["SZ_B"]["pumps"] == ["switch.pump1"]
+    assert rooms["SZ_B"]["valves"] == [["valve", "valve.trv_1"]]
+    assert rooms["SZ_C"]["pumps"] == ["switch.pump2"]
+    assert rooms["SZ_B"]["schedule"][1]["days"] == ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+
+
+def test_own_pumps_come_before_inherited(config):
+    config["zones"][0]["zones"][1]["pumps"] = [{"entity_id": "switch.pump3"}]
+    rooms = {r["name"]: r for r in compile_tree(config)["rooms"]}
+
+    assert rooms["SZ_B"]["pumps"] == ["switch.pump3", "switch.pump1"]
+
+
+def test_entry_data_from_the_config_flow(config):
+    """The config flow adds title and the import id to the entry data."""
+    data = {**config, CONF_IMPORT: config_hash(config), CONF_TITLE: NAME}
+
+    assert compile_tree(data) == compile_tree(config)
+    assert config_hash(data) == config_hash(config)
+
+
+@pytest.mark.parametrize(
+    ("change", "message"),
+    [
+        (
+            lambda c: c["zones"][1]["pumps"].append({"entity_id": "switch.pump1"}),
+            "main > zones[1] 'zone 2' > pumps[1]: switch.pump1 is already used at main > zones[0] 'Zone 1' > pumps[0]",
+        ),
+        (
+            lambda c: c["zones"][0]["zones"][1]["valves"].append({"switch": "switch.mainheater"}),
+            "main > zones[0] 'Zone 1' > zones[1] 'SZ_B' > valves[1]: switch.mainheater is already used at main",
+        ),
+        (
+            lambda c: c["zones"][0]["zones"][1]["valves"].append({}),
+            "main > zones[0] 'Zone 1' > zones[1] 'SZ_B' > valves[1]: either switch or valve is required",
+        ),
+        (
+            lambda c: c["zones"][0]["zones"][1]["valves"].append({"valves": "valve.x"}),
+            "main > zones[0] 'Zone 1' > zones[1]: extra keys not allowed @ data['valves'][1]['valves']",
+        ),
+        (
+            lambda c: c["zones"][0]["zones"][0].update(pump="switch.x"),
+            "main > zones[0] 'Zone 1' > zones[0]: extra keys not allowed @ data['pump']",
+        ),
+        (
+            lambda c: c["zones"][0]["zones"][0].update(schedule=[{"start": "6:00", "end": "8:00", "days": ["mo"]}]),
+            "main > zones[0] 'Zone 1' > zones[0]: ",
+        ),
+        (
+            lambda c: c["zones"][1]["zones"].append({"name": "SZ_A"}),
+            "main > zones[1] 'zone 2' > zones[1] 'SZ_A': room name SZ_A is already used at main > zones[0] 'Zone 1' > zones[0] 'SZ_A'",
+        ),
+        (
+            lambda c: c["zones"][1]["zones"].append({"name": "sz a"}),
+            "main > zones[1] 'zone 2' > zones[1] 'sz a': room name sz a is already used at main > zones[0] 'Zone 1' > zones[0] 'SZ_A'",
+        ),
+        (
+            lambda c: c["zones"][1]["zones"][0].pop("name"),
+            "main > zones[1] 'zone 2' > zones[0]: required key not provided @ data['name']",
+        ),
+    ],
+)
+def test_invalid_tree_reports_the_path(config, change, message):
+    change(config)
+    with pytest.raises(InvalidZoneTree) as err:
+        compile_tree(config)
+    assert str(err.value).startswith(message)
+
+
+def test_cyclic_reference_is_reported_by_the_hash():
+    config = yaml.safe_load(
+        """
+switch: switch.main
+zones:
+  - &loop
+    name: loop
+    zones:
+      - *loop
+"""
+    )
+    with pytest.raises(InvalidZoneTree) as err:
+        config_hash(config)
+    assert str(err.value) == "main > zones[0] > zones[0]: cyclic zone reference"
+
+
+async def test_cyclic_yaml_is_not_imported(hass, caplog):
+    config = yaml.safe_load(
+        """
+multizone_heating:
+  switch: switch.main
+  zones:
+    - &loop
+      name: loop
+      zones:
+        - *loop
+"""
+    )
+    assert not await async_setup_component(hass, DOMAIN, config)
+    assert "cyclic zone reference" in caplog.text
+    assert not hass.config_entries.async_entries(DOMAIN)
+
+
+async def test_entry_created_by_an_earlier_version_loads(hass, config):
+    """No cached tree, entry data with the keys of the config flow."""
+    data = {**copy.deepcopy(config), CONF_IMPORT: config_hash(config), CONF_TITLE: NAME}
+    entry = MockConfigEntry(domain=DOMAIN, title=NAME, data=data)
+    entry.add_to_hass(hass)
+
+    assert await hass.config_entries.async_setup(entry.entry_id)
+    await hass.async_block_till_done()
+    assert entry.state is ConfigEntryState.LOADED
+    assert len(hass.data[DOMAIN][entry.entry_id].rooms) == 3
+
+    assert await hass.config_entries.async_unload(entry.entry_id)
+
+
+async def test_tree_is_cached_by_version_and_hash(hass, hass_storage, config):
+    key = f"{TREE_VERSION}_{config_hash(config)}"
+    old = f"{TREE_VERSION - 1}_{config_hash(config)}"
+    hass_storage[STORAGE_KEY_TREE] = {
+        "version": STORAGE_VERSION,
+        "key": STORAGE_KEY_TREE,
+        "data": {old: {"rooms": []}},
+    }
+
+    with patch(
+        "custom_components.multizone_heating.tree.compile_tree", wraps=compile_tree
+    ) as compiler:
+        tree = await async_get_tree(hass, config)
+        assert await async_get_tree(hass, config) == tree
+        assert await async_get_tree(hass, {**config, CONF_IMPORT: config_hash(config)}) == tree
+
+    assert compiler.call_count == 1
+    assert len(tree["rooms"]) == 3
+    assert list(hass_storage[STORAGE_KEY_TREE]["data"]) == [key]